@@ -3,11 +3,22 @@
 Module 1: Basic MCP Server - Starter Code
 """
 
+import asyncio
+import codecs
 import json
-import subprocess
+import os
+import re
+from operator import itemgetter
 from pathlib import Path
+from typing import Any, Optional
 
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
 
 # Initialize the FastMCP server
 mcp = FastMCP("pr-agent")
@@ -15,148 +26,293 @@ mcp = FastMCP("pr-agent")
 # PR template directory (shared across all modules)
 TEMPLATES_DIR = Path(__file__).parent.parent.parent / "templates"
 
+# Mappings from change types to template files
+TEMPLATE_MAPPINGS = {
+    "bug": "bug.md",
+    "bugfix": "bug.md",
+    "fix": "bug.md",
+    "feature": "feature.md",
+    "feat": "feature.md",
+    "enhancement": "feature.md",
+    "docs": "docs.md",
+    "documentation": "docs.md",
+    "doc": "docs.md",
+    "refactor": "refactor.md",
+    "refactoring": "refactor.md",
+    "test": "test.md",
+    "tests": "test.md",
+    "testing": "test.md",
+    "performance": "performance.md",
+    "perf": "performance.md",
+    "optimization": "performance.md",
+    "security": "security.md",
+    "sec": "security.md"
+}
+
+# Finds any known change type inside a longer one (e.g. "bugs" -> "bug") in a
+# single scan; longer keys come first so "bugfix" wins over "bug"
+_MAPPING_KEY_PATTERN = re.compile(
+    "|".join(re.escape(key) for key in sorted(TEMPLATE_MAPPINGS, key=len, reverse=True))
+)
+
+
+def _mapping_key_fragments() -> dict[str, str]:
+    """Map every substring of a known change type to its template file.
+    
+    Lets abbreviated change types (e.g. "featur") resolve with one dict lookup;
+    earlier keys in TEMPLATE_MAPPINGS take precedence.
+    """
+    fragments: dict[str, str] = {}
+    for key, template_file in TEMPLATE_MAPPINGS.items():
+        for start in range(len(key)):
+            for end in range(start + 1, len(key) + 1):
+                fragments.setdefault(key[start:end], template_file)
+    return fragments
+
+
+_MAPPING_KEY_FRAGMENTS = _mapping_key_fragments()
+
+
+def _dumps(obj: Any, indent: bool = False) -> str:
+    """Serialize obj to a JSON string, using orjson when it is installed."""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    return json.dumps(obj, indent=2 if indent else None)
+
+
+# Pre-serialized error responses; only the JSON-encoded message is filled in per call
+_ANALYZE_ERROR = '{"error":%s,"files_changed":[],"diff":""}'
+_TEMPLATES_ERROR = '{"error":%s,"templates":[]}'
+
+
+def _load_templates() -> tuple[dict[str, dict], str]:
+    """Read all PR templates and pre-serialize the get_pr_templates response.
+    
+    Returns a mapping of filename to template entry, plus the JSON string
+    served by get_pr_templates.
+    """
+    # Check if templates directory exists
+    if not TEMPLATES_DIR.exists():
+        return {}, _TEMPLATES_ERROR % _dumps(f"Templates directory not found: {TEMPLATES_DIR}")
+    
+    try:
+        templates: list[dict[str, str]] = []
+        
+        # Read all .md files in the templates directory
+        with os.scandir(TEMPLATES_DIR) as entries:
+            template_entries = [e for e in entries if e.is_file() and e.name.endswith('.md')]
+        
+        for entry in template_entries:
+            # Extract template name from filename (remove .md extension)
+            filename = entry.name
+            template_name = filename[:-len('.md')]
+            
+            try:
+                # Read raw bytes and decode once, skipping text-mode newline translation
+                with open(entry.path, 'rb') as f:
+                    content = f.read().decode('utf-8')
+                
+                templates.append({
+                    "filename": filename,
+                    "name": template_name,
+                    "type": template_name,  # bug, feature, docs, etc.
+                    "content": content
+                })
+                
+            except Exception as e:
+                # If we can't read a specific template, include an error but continue
+                templates.append({
+                    "filename": filename,
+                    "name": template_name,
+                    "type": template_name,
+                    "error": f"Failed to read template: {str(e)}"
+                })
+        
+        # Sort templates by name for consistent ordering; this runs only when the
+        # cache is (re)built, and the cache keeps the same order
+        templates.sort(key=itemgetter("name"))
+        
+        return {t["filename"]: t for t in templates}, _dumps(templates)
+        
+    except Exception as e:
+        return {}, _TEMPLATES_ERROR % _dumps(f"Failed to get PR templates: {str(e)}")
+
+
+# Templates keyed on TEMPLATES_DIR's mtime when they were read: (mtime_ns, templates, json)
+_templates_cache: Optional[tuple[Optional[int], dict[str, dict], str]] = None
+
+
+def _get_templates() -> tuple[dict[str, dict], str]:
+    """Return the cached templates and get_pr_templates response.
+    
+    Adding, removing or renaming a template updates the directory's mtime, so
+    the templates are only read again after such a change.
+    """
+    global _templates_cache
+    
+    try:
+        mtime_ns = os.stat(TEMPLATES_DIR).st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    
+    if _templates_cache is None or _templates_cache[0] != mtime_ns:
+        templates, templates_json = _load_templates()
+        _templates_cache = (mtime_ns, templates, templates_json)
+    
+    return _templates_cache[1], _templates_cache[2]
+
+
+# Read the templates at import so the first tool call doesn't have to
+_get_templates()
+
+
+# The client's working directory, resolved from its roots on first use
+_working_dir_cache: Optional[str] = None
+_working_dir_lock = asyncio.Lock()
+
+
+async def _get_working_dir(ctx: Context) -> str:
+    """Return the working directory from the client's roots, asking only once."""
+    global _working_dir_cache
+    if _working_dir_cache is None:
+        async with _working_dir_lock:
+            if _working_dir_cache is None:
+                roots_result = await ctx.session.list_roots()
+                _working_dir_cache = roots_result.roots[0].uri.path if roots_result.roots else "."
+    return _working_dir_cache
+
+
 @mcp.tool()
-async def analyze_file_changes(base_branch: str = "main", include_diff: bool = True) -> str:
+async def analyze_file_changes(
+    base_branch: str = "main",
+    include_diff: bool = True,
+    ctx: Optional[Context] = None
+) -> str:
     """Get the full diff and list of changed files in the current git repository.
     
     Args:
         base_branch: Base branch to compare against (default: main)
         include_diff: Include the full diff content (default: true)
+        ctx: MCP request context, injected by FastMCP
     """
+    if ctx is None:
+        return _ANALYZE_ERROR % _dumps(
+            "No MCP request context: analyze_file_changes must be called through the MCP server"
+        )
+    
     try:
         # Get the working directory from MCP context
-        context = mcp.get_context()
-        roots_result = await context.session.list_roots()
-        working_dir = roots_result.roots[0].uri.path if roots_result.roots else "."
+        working_dir = await _get_working_dir(ctx)
+        
+        # A single git call returns the changed files (--raw) and, if requested,
+        # the patch; -z keeps filenames unquoted and NUL-separated
+        git_args = ["git", "diff", "--raw", "-z"]
+        if include_diff:
+            git_args.append("-p")
+        git_args.append(base_branch)
         
-        # Get list of changed files
-        result_files = subprocess.run(
-            ["git", "diff", "--name-status", base_branch],
-            capture_output=True,
-            text=True,
+        proc = await asyncio.create_subprocess_exec(
+            *git_args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
             cwd=working_dir
         )
+        # Both pipes were requested above, so neither stream is None
+        assert proc.stdout is not None and proc.stderr is not None
         
-        if result_files.returncode != 0:
-            return json.dumps({
-                "error": f"Git command failed: {result_files.stderr}",
-                "files_changed": [],
-                "diff": ""
-            })
+        # Handle token limit - stop reading once the diff exceeds the budget
+        # (approximately 20,000 chars = ~5,000 tokens) instead of capturing all of it.
+        # The diff is decoded as it arrives so the budget counts characters, not bytes
+        max_diff_chars = 20000
+        raw_section = bytearray()
+        in_diff = False
+        diff_parts: list[str] = []
+        diff_chars = 0
+        diff_truncated = False
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            chunk = await proc.stdout.read(65536)
+            if not chunk:
+                break
+            
+            if not in_diff:
+                scan_from = max(len(raw_section) - 1, 0)
+                raw_section += chunk
+                
+                # The raw section ends with an empty NUL-terminated field, followed by the patch
+                separator = raw_section.find(b'\0\0', scan_from)
+                if separator == -1:
+                    continue
+                chunk = bytes(raw_section[separator + 2:])
+                del raw_section[separator:]
+                in_diff = True
+            
+            text = decoder.decode(chunk)
+            diff_parts.append(text)
+            diff_chars += len(text)
+            
+            if diff_chars > max_diff_chars:
+                diff_truncated = True
+                try:
+                    proc.terminate()
+                except ProcessLookupError:
+                    pass
+                break
+        
+        stderr = await proc.stderr.read()
+        returncode = await proc.wait()
+        
+        if returncode != 0 and not diff_truncated:
+            return _ANALYZE_ERROR % _dumps(
+                f"Git command failed: {stderr.decode('utf-8', errors='replace')}"
+            )
+        
+        if not diff_truncated:
+            diff_parts.append(decoder.decode(b'', final=True))
+        raw_output = raw_section.decode('utf-8', errors='replace')
+        diff = "".join(diff_parts)
         
-        # Parse changed files
-        files_changed = []
-        for line in result_files.stdout.strip().split('\n'):
-            if line:
-                parts = line.split('\t')
-                if len(parts) >= 2:
-                    status = parts[0]
-                    filename = parts[1]
-                    files_changed.append({
-                        "status": status,
-                        "filename": filename
-                    })
+        # Parse changed files: each entry is ":<modes> <shas> <status>" then its path(s)
+        files_changed: list[dict[str, str]] = []
+        fields = raw_output.split('\0')
+        i = 0
+        while i + 1 < len(fields):
+            status = fields[i].rsplit(' ', 1)[-1]
+            filename = fields[i + 1]
+            files_changed.append({
+                "status": status,
+                "filename": filename
+            })
+            # Renames and copies list both the source and destination path
+            i += 3 if status[:1] in ('R', 'C') else 2
         
         result = {
             "files_changed": files_changed,
             "total_files": len(files_changed)
         }
         
-        # Get diff if requested
+        # Include diff if requested
         if include_diff and files_changed:
-            result_diff = subprocess.run(
-                ["git", "diff", base_branch],
-                capture_output=True,
-                text=True,
-                cwd=working_dir
-            )
-            
-            if result_diff.returncode == 0:
-                diff_content = result_diff.stdout
-                
-                # Handle token limit - truncate if too large (approximately 20,000 chars = ~5,000 tokens)
-                max_diff_chars = 20000
-                if len(diff_content) > max_diff_chars:
-                    diff_lines = diff_content.split('\n')
-                    truncated_lines = []
-                    char_count = 0
-                    
-                    for line in diff_lines:
-                        if char_count + len(line) + 1 > max_diff_chars:
-                            break
-                        truncated_lines.append(line)
-                        char_count += len(line) + 1
-                    
-                    result["diff"] = '\n'.join(truncated_lines)
-                    result["diff_truncated"] = True
-                    result["original_diff_size"] = len(diff_content)
-                else:
-                    result["diff"] = diff_content
-                    result["diff_truncated"] = False
-            else:
-                result["diff"] = ""
-                result["diff_error"] = result_diff.stderr
+            if diff_truncated:
+                # Cut at the last complete line that fits within the budget
+                cut = diff.rfind('\n', 0, max_diff_chars)
+                diff = diff[:max(cut, 0)]
+            result["diff"] = diff
+            result["diff_truncated"] = diff_truncated
         else:
             result["diff"] = ""
             
-        return json.dumps(result)
+        return _dumps(result)
         
     except Exception as e:
-        return json.dumps({
-            "error": f"Exception occurred: {str(e)}",
-            "files_changed": [],
-            "diff": ""
-        })
+        return _ANALYZE_ERROR % _dumps(f"Exception occurred: {str(e)}")
 
 
 @mcp.tool()
 async def get_pr_templates() -> str:
     """List available PR templates with their content."""
-    try:
-        templates = []
-        
-        # Check if templates directory exists
-        if not TEMPLATES_DIR.exists():
-            return json.dumps({
-                "error": f"Templates directory not found: {TEMPLATES_DIR}",
-                "templates": []
-            })
-        
-        # Read all .md files in the templates directory
-        for template_file in TEMPLATES_DIR.glob("*.md"):
-            try:
-                with open(template_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Extract template name from filename (remove .md extension)
-                template_name = template_file.stem
-                
-                templates.append({
-                    "filename": template_file.name,
-                    "name": template_name,
-                    "type": template_name,  # bug, feature, docs, etc.
-                    "content": content
-                })
-                
-            except Exception as e:
-                # If we can't read a specific template, include an error but continue
-                templates.append({
-                    "filename": template_file.name,
-                    "name": template_file.stem,
-                    "type": template_file.stem,
-                    "error": f"Failed to read template: {str(e)}"
-                })
-        
-        # Sort templates by name for consistent ordering
-        templates.sort(key=lambda x: x.get('name', ''))
-        
-        return json.dumps(templates)
-        
-    except Exception as e:
-        return json.dumps({
-            "error": f"Failed to get PR templates: {str(e)}",
-            "templates": []
-        })
+    _, templates_json = _get_templates()
+    return templates_json
 
 
 @mcp.tool()
@@ -168,41 +324,23 @@ async def suggest_template(changes_summary: str, change_type: str) -> str:
         change_type: The type of change you've identified (bug, feature, docs, refactor, test, etc.)
     """
     try:
-        # Define mappings from change types to template files
-        template_mappings = {
-            "bug": "bug.md",
-            "bugfix": "bug.md", 
-            "fix": "bug.md",
-            "feature": "feature.md",
-            "feat": "feature.md",
-            "enhancement": "feature.md",
-            "docs": "docs.md",
-            "documentation": "docs.md",
-            "doc": "docs.md",
-            "refactor": "refactor.md",
-            "refactoring": "refactor.md",
-            "test": "test.md",
-            "tests": "test.md",
-            "testing": "test.md",
-            "performance": "performance.md",
-            "perf": "performance.md",
-            "optimization": "performance.md",
-            "security": "security.md",
-            "sec": "security.md"
-        }
-        
-        # Normalize the change type to lowercase for matching
-        normalized_type = change_type.lower().strip()
-        
-        # Find the appropriate template
-        suggested_template_file = template_mappings.get(normalized_type)
+        # Find the appropriate template, trying the change type exactly as given
+        # first so the common case skips normalization
+        suggested_template_file = TEMPLATE_MAPPINGS.get(change_type)
         
         if not suggested_template_file:
-            # If no exact match, try to find a partial match
-            for key, template_file in template_mappings.items():
-                if key in normalized_type or normalized_type in key:
-                    suggested_template_file = template_file
-                    break
+            # Normalize the change type to lowercase for matching
+            normalized_type = change_type.lower().strip()
+            suggested_template_file = TEMPLATE_MAPPINGS.get(normalized_type)
+            
+            if not suggested_template_file:
+                # If no exact match, try to find a partial match: a known key inside
+                # the change type, or the change type as a fragment of a known key
+                match = _MAPPING_KEY_PATTERN.search(normalized_type)
+                if match:
+                    suggested_template_file = TEMPLATE_MAPPINGS[match.group()]
+                else:
+                    suggested_template_file = _MAPPING_KEY_FRAGMENTS.get(normalized_type)
         
         # If still no match, default to feature template
         if not suggested_template_file:
@@ -211,43 +349,40 @@ async def suggest_template(changes_summary: str, change_type: str) -> str:
         else:
             fallback_used = False
         
-        # Try to read the suggested template
-        template_path = TEMPLATES_DIR / suggested_template_file
+        # Look up the suggested template in the in-memory cache
+        templates, _ = _get_templates()
+        template = templates.get(suggested_template_file)
         
-        if template_path.exists():
-            try:
-                with open(template_path, 'r', encoding='utf-8') as f:
-                    template_content = f.read()
-                
-                result = {
-                    "recommended_template": suggested_template_file,
-                    "template_type": template_path.stem,
-                    "template_content": template_content,
-                    "changes_summary": changes_summary,
-                    "detected_change_type": change_type,
-                    "fallback_used": fallback_used
-                }
-                
-                if fallback_used:
-                    result["note"] = f"No specific template found for '{change_type}', defaulting to feature template"
-                
-                return json.dumps(result)
-                
-            except Exception as e:
-                return json.dumps({
-                    "error": f"Failed to read template file {suggested_template_file}: {str(e)}",
-                    "recommended_template": suggested_template_file,
-                    "template_type": template_path.stem
-                })
-        else:
-            return json.dumps({
+        if template is None:
+            return _dumps({
                 "error": f"Template file not found: {suggested_template_file}",
-                "available_templates": list(template_mappings.values()),
+                "available_templates": list(TEMPLATE_MAPPINGS.values()),
                 "detected_change_type": change_type
             })
+        
+        if "error" in template:
+            return _dumps({
+                "error": template["error"],
+                "recommended_template": suggested_template_file,
+                "template_type": template["type"]
+            })
+        
+        result = {
+            "recommended_template": suggested_template_file,
+            "template_type": template["type"],
+            "template_content": template["content"],
+            "changes_summary": changes_summary,
+            "detected_change_type": change_type,
+            "fallback_used": fallback_used
+        }
+        
+        if fallback_used:
+            result["note"] = f"No specific template found for '{change_type}', defaulting to feature template"
+        
+        return _dumps(result)
             
     except Exception as e:
-        return json.dumps({
+        return _dumps({
             "error": f"Failed to suggest template: {str(e)}",
             "changes_summary": changes_summary,
             "change_type": change_type
@@ -255,4 +390,13 @@ async def suggest_template(changes_summary: str, change_type: str) -> str:
 
 
 if __name__ == "__main__":
-    mcp.run()
\ No newline at end of file
+    import importlib.util
+    
+    if importlib.util.find_spec("uvloop") is not None:
+        import anyio
+        
+        # Run on uvloop's faster event loop when it is installed (it is not available
+        # on Windows); anyio sets it up without the uvloop.install() deprecated in 3.12
+        anyio.run(mcp.run_stdio_async, backend_options={"use_uvloop": True})
+    else:
+        mcp.run()
\ No newline at end of file
@@ -4,15 +4,21 @@ Module 2: GitHub Actions Integration - STARTER CODE
 Extend your PR Agent with webhook handling and MCP Prompts for CI/CD workflows.
 """
 
+import asyncio
 import json
 import os
-import subprocess
-from typing import Optional
+from typing import Any, Optional, Union
 from pathlib import Path
 from datetime import datetime
 
 from mcp.server.fastmcp import FastMCP
 
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
 # Initialize the FastMCP server
 mcp = FastMCP("pr-agent-actions")
 
@@ -30,6 +36,7 @@ DEFAULT_TEMPLATES = {
     "security.md": "Security"
 }
 
+# Events file written by webhook_server.py (a JSON array of events)
 EVENTS_FILE = Path(__file__).parent / "github_events.json"
 
 # Type mapping for PR templates
@@ -50,6 +57,133 @@ TYPE_MAPPING = {
 }
 
 
+def _dumps(obj: Any, indent: bool = False) -> str:
+    """Serialize obj to a JSON string, using orjson when it is installed."""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    return json.dumps(obj, indent=2 if indent else None)
+
+
+def _loads(data: Union[str, bytes]) -> Any:
+    """Parse a JSON document from str or bytes, using orjson when it is installed."""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Pre-serialized error response; only the JSON-encoded message is filled in per call
+_ERROR = '{"error":%s}'
+
+
+def _load_templates() -> dict[str, dict]:
+    """Read the default PR templates, keyed by filename.
+    
+    A template that can't be read gets an "error" entry instead of its
+    content, so a missing file doesn't stop the server from starting.
+    """
+    templates: dict[str, dict] = {}
+    for filename, template_type in DEFAULT_TEMPLATES.items():
+        try:
+            templates[filename] = {
+                "filename": filename,
+                "type": template_type,
+                "content": (TEMPLATES_DIR / filename).read_text(encoding="utf-8")
+            }
+        except Exception as e:
+            templates[filename] = {
+                "filename": filename,
+                "type": template_type,
+                "error": f"Failed to read template: {str(e)}"
+            }
+    return templates
+
+
+# Templates are static for the life of the server, so read them once at import
+_TEMPLATE_CACHE = _load_templates()
+_TEMPLATES_JSON = _dumps(list(_TEMPLATE_CACHE.values()), indent=True)
+
+
+def _decode(data: bytes) -> str:
+    """Decode git output as UTF-8, replacing invalid bytes instead of failing."""
+    return data.decode("utf-8", errors="replace")
+
+
+async def _run_git(*args: str) -> tuple[bytes, bytes, int]:
+    """Run a git command without blocking the event loop.
+    
+    Returns:
+        Tuple of (stdout, stderr, returncode), with the output left as bytes
+    """
+    proc = await asyncio.create_subprocess_exec(
+        "git", *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await proc.communicate()
+    # communicate() has already waited for git, so wait() just returns its exit code
+    return stdout, stderr, await proc.wait()
+
+
+def _read_events() -> Any:
+    """Parse EVENTS_FILE, a JSON array of events in the order they were received."""
+    return _loads(EVENTS_FILE.read_bytes())
+
+
+# Latest run per workflow, keyed on EVENTS_FILE's (mtime, size) when it was parsed
+_workflow_runs_cache: tuple[Optional[tuple[int, int]], Optional[dict]] = (None, None)
+
+
+def _latest_workflow_runs() -> Optional[dict[str, dict]]:
+    """Return the most recent workflow_run of each workflow in EVENTS_FILE.
+    
+    The file is only parsed again once its modification time or size changes.
+    Returns None if the file does not hold a list of events.
+    """
+    global _workflow_runs_cache
+    
+    stat = EVENTS_FILE.stat()
+    file_key = (stat.st_mtime_ns, stat.st_size)
+    cached_key, cached_workflows = _workflow_runs_cache
+    if cached_key == file_key:
+        return cached_workflows
+    
+    events = _read_events()
+    
+    if not isinstance(events, list):
+        _workflow_runs_cache = (file_key, None)
+        return None
+    
+    # Keep the most recent workflow_run event of each workflow in a single pass.
+    # Parsed JSON objects are always plain dicts, so an exact type check suffices.
+    workflows: dict[str, dict] = {}
+    for event in events:
+        if type(event) is not dict or event.get('type') != 'workflow_run':
+            continue
+        
+        workflow_data = event.get('payload', {}).get('workflow_run', {})
+        if not workflow_data:
+            continue
+        
+        get = workflow_data.get
+        wf_name = get('name', 'Unknown')
+        event_time = get('updated_at', get('created_at', ''))
+        
+        latest = workflows.get(wf_name)
+        if latest is None or event_time > latest['updated_at']:
+            workflows[wf_name] = {
+                'name': wf_name,
+                'status': get('status', 'unknown'),
+                'conclusion': get('conclusion', None),
+                'updated_at': event_time,
+                'head_branch': get('head_branch', 'unknown'),
+                'html_url': get('html_url', ''),
+                'run_number': get('run_number', 0)
+            }
+    
+    _workflow_runs_cache = (file_key, workflows)
+    return workflows
+
+
 # ===== Module 1 Tools (Already includes output limiting fix from Module 1) =====
 
 @mcp.tool()
@@ -66,79 +200,81 @@ async def analyze_file_changes(
         max_diff_lines: Maximum number of diff lines to include (default: 500)
     """
     try:
-        # Get list of changed files
-        files_result = subprocess.run(
-            ["git", "diff", "--name-status", f"{base_branch}...HEAD"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
+        # A single git call returns the changed files (--raw), the statistics
+        # (--stat) and, if requested, the actual diff
+        diff_args = ["diff", "--raw", "--stat"]
+        if include_diff:
+            diff_args.append("-p")
+        diff_args.append(f"{base_branch}...HEAD")
         
-        # Get diff statistics
-        stat_result = subprocess.run(
-            ["git", "diff", "--stat", f"{base_branch}...HEAD"],
-            capture_output=True,
-            text=True
+        # Run the diff and the commit log for context concurrently
+        (diff_stdout, diff_stderr, diff_returncode), (commits, _, _) = await asyncio.gather(
+            _run_git(*diff_args),
+            _run_git("log", "--oneline", f"{base_branch}..HEAD")
         )
         
-        # Get the actual diff if requested
+        if diff_returncode != 0:
+            return _ERROR % _dumps(f"Git error: {_decode(diff_stderr)}")
+        
+        # Work on git's raw bytes and decode each field once, at the end.
+        # The raw and stat summary is separated from the diff by a blank line
+        summary, _, diff_output = diff_stdout.partition(b'\n\n')
+        
+        # Split the summary into --name-status style file lines and --stat lines
+        files_changed: list[bytes] = []
+        statistics: list[bytes] = []
+        for line in summary.split(b'\n'):
+            if not line:
+                continue
+            if line.startswith(b':'):
+                # ":<modes> <shas> <status>\t<path(s)>" -> "<status>\t<path(s)>"
+                meta, _, paths = line.partition(b'\t')
+                files_changed.append(meta.rsplit(b' ', 1)[-1] + b'\t' + paths + b'\n')
+            else:
+                statistics.append(line + b'\n')
+        
+        # Truncate the diff if requested
         diff_content = ""
         truncated = False
+        total_diff_lines = 0
         if include_diff:
-            diff_result = subprocess.run(
-                ["git", "diff", f"{base_branch}...HEAD"],
-                capture_output=True,
-                text=True
-            )
-            diff_lines = diff_result.stdout.split('\n')
+            total_diff_lines = diff_output.count(b'\n') + 1
             
             # Check if we need to truncate (learned from Module 1)
-            if len(diff_lines) > max_diff_lines:
-                diff_content = '\n'.join(diff_lines[:max_diff_lines])
-                diff_content += f"\n\n... Output truncated. Showing {max_diff_lines} of {len(diff_lines)} lines ..."
+            if total_diff_lines > max_diff_lines:
+                # Locate the end of the first max_diff_lines lines without splitting the diff
+                cut = 0
+                if max_diff_lines > 0:
+                    cut = -1
+                    for _ in range(max_diff_lines):
+                        cut = diff_output.find(b'\n', cut + 1)
+                diff_content = _decode(diff_output[:cut])
+                diff_content += f"\n\n... Output truncated. Showing {max_diff_lines} of {total_diff_lines} lines ..."
                 diff_content += "\n... Use max_diff_lines parameter to see more ..."
                 truncated = True
             else:
-                diff_content = diff_result.stdout
-        
-        # Get commit messages for context
-        commits_result = subprocess.run(
-            ["git", "log", "--oneline", f"{base_branch}..HEAD"],
-            capture_output=True,
-            text=True
-        )
+                diff_content = _decode(diff_output)
         
         analysis = {
             "base_branch": base_branch,
-            "files_changed": files_result.stdout,
-            "statistics": stat_result.stdout,
-            "commits": commits_result.stdout,
+            "files_changed": _decode(b"".join(files_changed)),
+            "statistics": _decode(b"".join(statistics)),
+            "commits": _decode(commits),
             "diff": diff_content if include_diff else "Diff not included (set include_diff=true to see full diff)",
             "truncated": truncated,
-            "total_diff_lines": len(diff_lines) if include_diff else 0
+            "total_diff_lines": total_diff_lines
         }
         
-        return json.dumps(analysis, indent=2)
+        return _dumps(analysis, indent=True)
         
-    except subprocess.CalledProcessError as e:
-        return json.dumps({"error": f"Git error: {e.stderr}"})
     except Exception as e:
-        return json.dumps({"error": str(e)})
+        return _ERROR % _dumps(str(e))
 
 
 @mcp.tool()
 async def get_pr_templates() -> str:
     """List available PR templates with their content."""
-    templates = [
-        {
-            "filename": filename,
-            "type": template_type,
-            "content": (TEMPLATES_DIR / filename).read_text()
-        }
-        for filename, template_type in DEFAULT_TEMPLATES.items()
-    ]
-    
-    return json.dumps(templates, indent=2)
+    return _TEMPLATES_JSON
 
 
 @mcp.tool()
@@ -150,16 +286,21 @@ async def suggest_template(changes_summary: str, change_type: str) -> str:
         change_type: The type of change you've identified (bug, feature, docs, refactor, test, etc.)
     """
     
-    # Get available templates
-    templates_response = await get_pr_templates()
-    templates = json.loads(templates_response)
+    # Find matching template, only lowercasing the change type if it isn't a key as given
+    template_file = TYPE_MAPPING.get(change_type) or TYPE_MAPPING.get(change_type.lower(), "feature.md")
     
-    # Find matching template
-    template_file = TYPE_MAPPING.get(change_type.lower(), "feature.md")
-    selected_template = next(
-        (t for t in templates if t["filename"] == template_file),
-        templates[0]  # Default to first template if no match
-    )
+    # Look the template up in the in-memory cache rather than via get_pr_templates' JSON
+    selected_template = _TEMPLATE_CACHE.get(template_file)
+    if selected_template is None:
+        # Default to first template if no match
+        selected_template = next(iter(_TEMPLATE_CACHE.values()))
+    
+    if "error" in selected_template:
+        return _dumps({
+            "error": selected_template["error"],
+            "recommended_template": selected_template["filename"],
+            "template_type": selected_template["type"]
+        }, indent=True)
     
     suggestion = {
         "recommended_template": selected_template,
@@ -168,7 +309,7 @@ async def suggest_template(changes_summary: str, change_type: str) -> str:
         "usage_hint": "Claude can help you fill out this template based on the specific changes in your PR."
     }
     
-    return json.dumps(suggestion, indent=2)
+    return _dumps(suggestion, indent=True)
 
 
 # ===== Module 2: New GitHub Actions Tools =====
@@ -183,29 +324,29 @@ async def get_recent_actions_events(limit: int = 10) -> str:
     try:
         # Check if EVENTS_FILE exists
         if not EVENTS_FILE.exists():
-            return json.dumps({"events": [], "message": "No events file found"})
+            return _dumps({"events": [], "message": "No events file found"})
         
-        # Read the JSON file
-        with open(EVENTS_FILE, 'r') as f:
-            events = json.load(f)
+        events = _read_events()
         
-        # Return the most recent events (up to limit)
-        # Events are typically stored with most recent first, but let's ensure proper ordering
+        # Return the most recent events (up to limit); webhook_server.py
+        # appends new events to the end of the array
         if isinstance(events, list):
-            recent_events = events[:limit]
+            total_events = len(events)
+            recent_events = events[max(total_events - limit, 0):]
         else:
+            total_events = 0
             recent_events = []
         
-        return json.dumps({
+        return _dumps({
             "events": recent_events,
-            "total_events": len(events) if isinstance(events, list) else 0,
+            "total_events": total_events,
             "showing": len(recent_events)
-        }, indent=2)
+        }, indent=True)
         
     except json.JSONDecodeError as e:
-        return json.dumps({"error": f"Invalid JSON in events file: {str(e)}"})
+        return _ERROR % _dumps(f"Invalid JSON in events file: {str(e)}")
     except Exception as e:
-        return json.dumps({"error": f"Error reading events: {str(e)}"})
+        return _ERROR % _dumps(f"Error reading events: {str(e)}")
 
 
 @mcp.tool()
@@ -218,46 +359,16 @@ async def get_workflow_status(workflow_name: Optional[str] = None) -> str:
     try:
         # Read events from EVENTS_FILE
         if not EVENTS_FILE.exists():
-            return json.dumps({"workflows": {}, "message": "No events file found"})
-        
-        with open(EVENTS_FILE, 'r') as f:
-            events = json.load(f)
+            return _dumps({"workflows": {}, "message": "No events file found"})
         
-        if not isinstance(events, list):
-            return json.dumps({"workflows": {}, "message": "Invalid events format"})
+        workflows = _latest_workflow_runs()
         
-        # Filter events for workflow_run events
-        workflow_events = []
-        for event in events:
-            if isinstance(event, dict) and event.get('type') == 'workflow_run':
-                workflow_events.append(event)
+        if workflows is None:
+            return _dumps({"workflows": {}, "message": "Invalid events format"})
         
-        # Group by workflow and show latest status
-        workflows = {}
-        for event in workflow_events:
-            workflow_data = event.get('payload', {}).get('workflow_run', {})
-            if not workflow_data:
-                continue
-                
-            wf_name = workflow_data.get('name', 'Unknown')
-            
-            # If workflow_name provided, filter by that name
-            if workflow_name and wf_name != workflow_name:
-                continue
-            
-            # Track the most recent event for each workflow
-            event_time = workflow_data.get('updated_at', workflow_data.get('created_at', ''))
-            
-            if wf_name not in workflows or event_time > workflows[wf_name].get('updated_at', ''):
-                workflows[wf_name] = {
-                    'name': wf_name,
-                    'status': workflow_data.get('status', 'unknown'),
-                    'conclusion': workflow_data.get('conclusion', None),
-                    'updated_at': event_time,
-                    'head_branch': workflow_data.get('head_branch', 'unknown'),
-                    'html_url': workflow_data.get('html_url', ''),
-                    'run_number': workflow_data.get('run_number', 0)
-                }
+        # If workflow_name provided, filter by that name
+        if workflow_name:
+            workflows = {workflow_name: workflows[workflow_name]} if workflow_name in workflows else {}
         
         result = {
             "workflows": workflows,
@@ -265,20 +376,18 @@ async def get_workflow_status(workflow_name: Optional[str] = None) -> str:
             "filtered_by": workflow_name if workflow_name else "all workflows"
         }
         
-        return json.dumps(result, indent=2)
+        return _dumps(result, indent=True)
         
     except json.JSONDecodeError as e:
-        return json.dumps({"error": f"Invalid JSON in events file: {str(e)}"})
+        return _ERROR % _dumps(f"Invalid JSON in events file: {str(e)}")
     except Exception as e:
-        return json.dumps({"error": f"Error reading workflow status: {str(e)}"})
+        return _ERROR % _dumps(f"Error reading workflow status: {str(e)}")
 
 
 # ===== Module 2: MCP Prompts =====
 
-@mcp.prompt()
-async def analyze_ci_results():
-    """Analyze recent CI/CD results and provide insights."""
-    return """You are a CI/CD analyst helping a development team understand their build and deployment pipeline health.
+# Prompt bodies are constant, so they are defined once at module level
+_PROMPT_ANALYZE_CI = """You are a CI/CD analyst helping a development team understand their build and deployment pipeline health.
 
 Please follow these steps to analyze the recent CI/CD results:
 
@@ -307,11 +416,7 @@ Please follow these steps to analyze the recent CI/CD results:
 
 Focus on being data-driven and actionable in your analysis."""
 
-
-@mcp.prompt()
-async def create_deployment_summary():
-    """Generate a deployment summary for team communication."""
-    return """You are a technical communication specialist helping create clear, concise deployment summaries for cross-functional teams.
+_PROMPT_DEPLOYMENT_SUMMARY = """You are a technical communication specialist helping create clear, concise deployment summaries for cross-functional teams.
 
 Please create a deployment summary by following these steps:
 
@@ -344,11 +449,7 @@ Please create a deployment summary by following these steps:
 
 Focus on clarity, accuracy, and actionability for non-technical stakeholders."""
 
-
-@mcp.prompt()
-async def generate_pr_status_report():
-    """Generate a comprehensive PR status report including CI/CD results."""
-    return """You are a code review facilitator creating comprehensive pull request status reports that combine code analysis with CI/CD pipeline results.
+_PROMPT_PR_STATUS_REPORT = """You are a code review facilitator creating comprehensive pull request status reports that combine code analysis with CI/CD pipeline results.
 
 Please generate a complete PR status report by following these steps:
 
@@ -399,11 +500,7 @@ Please generate a complete PR status report by following these steps:
 
 Use clear formatting with sections, bullet points, and status indicators for easy scanning."""
 
-
-@mcp.prompt()
-async def troubleshoot_workflow_failure():
-    """Help troubleshoot a failing GitHub Actions workflow."""
-    return """You are a DevOps engineer specializing in GitHub Actions troubleshooting. Help systematically diagnose and resolve workflow failures.
+_PROMPT_TROUBLESHOOT_WORKFLOW = """You are a DevOps engineer specializing in GitHub Actions troubleshooting. Help systematically diagnose and resolve workflow failures.
 
 Follow this structured troubleshooting approach:
 
@@ -461,7 +558,40 @@ Follow this structured troubleshooting approach:
 Be methodical, provide specific actionable steps, and explain the reasoning behind each recommendation."""
 
 
+@mcp.prompt()
+def analyze_ci_results() -> str:
+    """Analyze recent CI/CD results and provide insights."""
+    return _PROMPT_ANALYZE_CI
+
+
+@mcp.prompt()
+def create_deployment_summary() -> str:
+    """Generate a deployment summary for team communication."""
+    return _PROMPT_DEPLOYMENT_SUMMARY
+
+
+@mcp.prompt()
+def generate_pr_status_report() -> str:
+    """Generate a comprehensive PR status report including CI/CD results."""
+    return _PROMPT_PR_STATUS_REPORT
+
+
+@mcp.prompt()
+def troubleshoot_workflow_failure() -> str:
+    """Help troubleshoot a failing GitHub Actions workflow."""
+    return _PROMPT_TROUBLESHOOT_WORKFLOW
+
+
 if __name__ == "__main__":
     print("Starting PR Agent MCP server...")
     print("NOTE: Run webhook_server.py in a separate terminal to receive GitHub events")
-    mcp.run()
\ No newline at end of file
+    import importlib.util
+    
+    if importlib.util.find_spec("uvloop") is not None:
+        import anyio
+        
+        # Run on uvloop's faster event loop when it is installed (it is not available
+        # on Windows); anyio sets it up without the uvloop.install() deprecated in 3.12
+        anyio.run(mcp.run_stdio_async, backend_options={"use_uvloop": True})
+    else:
+        mcp.run()
\ No newline at end of file
@@ -7,8 +7,9 @@ Run these tests to validate your implementation
 import json
 import pytest
 import asyncio
+import subprocess
 from pathlib import Path
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
 # Import your implemented functions
 try:
@@ -23,6 +24,43 @@ except ImportError as e:
     IMPORTS_SUCCESSFUL = False
     IMPORT_ERROR = str(e)
 
+try:
+    import server
+    import webhook_server
+    EVENT_IMPORTS_SUCCESSFUL = True
+except ImportError:
+    EVENT_IMPORTS_SUCCESSFUL = False
+
+
+def _git(repo, *args):
+    """Run a git command in repo and return its output."""
+    return subprocess.run(
+        ["git", *args], cwd=repo, check=True, capture_output=True, text=True
+    ).stdout
+
+
+@pytest.fixture
+def git_repo(tmp_path, monkeypatch):
+    """Create a repository whose HEAD modifies, renames and adds files relative to main."""
+    _git(tmp_path, "init", "-q", "-b", "main")
+    _git(tmp_path, "config", "user.email", "test@example.com")
+    _git(tmp_path, "config", "user.name", "Test")
+    (tmp_path / "app.py").write_text("print('hello')\n")
+    (tmp_path / "old_name.py").write_text("".join(f"line {i}\n" for i in range(20)))
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "commit", "-q", "-m", "Initial commit")
+    
+    _git(tmp_path, "checkout", "-q", "-b", "feature")
+    (tmp_path / "app.py").write_text("print('hello, world')\n")
+    _git(tmp_path, "mv", "old_name.py", "new_name.py")
+    (tmp_path / "my notes.txt").write_text("some notes\n")
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "commit", "-q", "-m", "Change files")
+    
+    # analyze_file_changes runs git in the current directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
 
 class TestImplementation:
     """Test that the required functions are implemented."""
@@ -43,8 +81,8 @@ class TestAnalyzeFileChanges:
     @pytest.mark.asyncio
     async def test_returns_json_string(self):
         """Test that analyze_file_changes returns a JSON string."""
-        with patch('subprocess.run') as mock_run:
-            mock_run.return_value = MagicMock(stdout="", stderr="")
+        with patch('server._run_git', new_callable=AsyncMock) as mock_run:
+            mock_run.return_value = (b"", b"", 0)
             
             result = await analyze_file_changes()
             
@@ -56,8 +94,8 @@ class TestAnalyzeFileChanges:
     @pytest.mark.asyncio
     async def test_includes_required_fields(self):
         """Test that the result includes expected fields."""
-        with patch('subprocess.run') as mock_run:
-            mock_run.return_value = MagicMock(stdout="M\tfile1.py\n", stderr="")
+        with patch('server._run_git', new_callable=AsyncMock) as mock_run:
+            mock_run.return_value = (b":100644 100644 abc1234 def5678 M\tfile1.py\n", b"", 0)
             
             result = await analyze_file_changes()
             data = json.loads(result)
@@ -65,6 +103,27 @@ class TestAnalyzeFileChanges:
             # Check for some expected fields (flexible to allow different implementations)
             assert any(key in data for key in ["files_changed", "files", "changes", "diff"]), \
                 "Result should include file change information"
+    
+    @pytest.mark.asyncio
+    async def test_matches_separate_git_commands(self, git_repo):
+        """The combined git call gives the same fields as separate diff commands."""
+        data = json.loads(await analyze_file_changes(max_diff_lines=10000))
+        
+        assert data["files_changed"] == _git(git_repo, "diff", "--name-status", "main...HEAD")
+        assert data["statistics"] == _git(git_repo, "diff", "--stat", "main...HEAD")
+        assert data["diff"] == _git(git_repo, "diff", "main...HEAD")
+        assert data["commits"] == _git(git_repo, "log", "--oneline", "main..HEAD")
+        assert data["truncated"] is False
+    
+    @pytest.mark.asyncio
+    async def test_truncates_to_max_diff_lines(self, git_repo):
+        """A truncated diff keeps the first max_diff_lines lines of git's diff."""
+        data = json.loads(await analyze_file_changes(max_diff_lines=5))
+        
+        diff_lines = _git(git_repo, "diff", "main...HEAD").split("\n")
+        assert data["truncated"] is True
+        assert data["total_diff_lines"] == len(diff_lines)
+        assert data["diff"].startswith("\n".join(diff_lines[:5]) + "\n\n... Output truncated.")
 
 
 @pytest.mark.skipif(not IMPORTS_SUCCESSFUL, reason="Imports failed")
@@ -144,6 +203,135 @@ class TestToolRegistration:
             "suggest_template should be a proper function"
 
 
+@pytest.mark.skipif(not EVENT_IMPORTS_SUCCESSFUL, reason="Imports failed")
+class TestTemplateLoading:
+    """Test reading the PR templates at import."""
+    
+    @pytest.mark.asyncio
+    async def test_missing_template_reports_error(self, tmp_path, monkeypatch):
+        """A missing template gets an error entry instead of raising."""
+        (tmp_path / "bug.md").write_text("## Bug Fix")
+        monkeypatch.setattr(server, "TEMPLATES_DIR", tmp_path)
+        
+        templates = server._load_templates()
+        assert templates["bug.md"]["content"] == "## Bug Fix"
+        assert "error" in templates["feature.md"]
+        
+        monkeypatch.setattr(server, "_TEMPLATE_CACHE", templates)
+        data = json.loads(await suggest_template("Added a new page", "feature"))
+        assert "error" in data
+        assert data["recommended_template"] == "feature.md"
+
+
+@pytest.fixture
+def events_file(tmp_path, monkeypatch):
+    """Point both the webhook server and the MCP server at a temporary events file."""
+    path = tmp_path / "github_events.json"
+    monkeypatch.setattr(webhook_server, "EVENTS_FILE", path)
+    monkeypatch.setattr(webhook_server, "_event_count", None)
+    monkeypatch.setattr(server, "EVENTS_FILE", path)
+    monkeypatch.setattr(server, "_workflow_runs_cache", (None, None))
+    return path
+
+
+@pytest.mark.skipif(not EVENT_IMPORTS_SUCCESSFUL, reason="Imports failed")
+class TestWebhookEventFile:
+    """Test how webhook_server.py stores events."""
+    
+    def test_append_round_trip(self, events_file):
+        """Appended events are read back in order from a plain JSON array."""
+        for i in range(3):
+            webhook_server.append_event({"id": i})
+        
+        assert webhook_server.read_events() == [{"id": 0}, {"id": 1}, {"id": 2}]
+        assert json.loads(events_file.read_text()) == [{"id": 0}, {"id": 1}, {"id": 2}]
+    
+    def test_compaction_keeps_last_events(self, events_file):
+        """Once the file doubles past MAX_EVENTS, only the newest MAX_EVENTS remain."""
+        max_events = webhook_server.MAX_EVENTS
+        for i in range(2 * max_events + 1):
+            webhook_server.append_event({"id": i})
+        
+        events = webhook_server.read_events()
+        assert len(events) == max_events
+        assert events[0] == {"id": max_events + 1}
+        assert events[-1] == {"id": 2 * max_events}
+    
+    def test_append_to_existing_array(self, events_file):
+        """Events are added to an array written by json.dump or by hand."""
+        events_file.write_text(json.dumps([{"id": 0}, {"id": 1}], indent=2) + "\n\n")
+        
+        webhook_server.append_event({"id": 2})
+        
+        assert json.loads(events_file.read_text()) == [{"id": 0}, {"id": 1}, {"id": 2}]
+    
+    def test_append_to_empty_array(self, events_file):
+        """The first event in an empty array is added without a leading comma."""
+        events_file.write_text("[]")
+        
+        webhook_server.append_event({"id": 0, "note": "line\u2028separator"})
+        
+        assert json.loads(events_file.read_text()) == [{"id": 0, "note": "line\u2028separator"}]
+    
+    def test_rejects_non_array(self, events_file):
+        """A file that doesn't hold a JSON array is left untouched."""
+        events_file.write_text('{"id": 0}')
+        
+        with pytest.raises(ValueError):
+            webhook_server.append_event({"id": 1})
+        assert events_file.read_text() == '{"id": 0}'
+
+
+@pytest.mark.skipif(not EVENT_IMPORTS_SUCCESSFUL, reason="Imports failed")
+class TestReadEvents:
+    """Test that the GitHub Actions tools read the events file."""
+    
+    @pytest.mark.asyncio
+    async def test_recent_events_returns_newest(self, events_file):
+        """The newest events come back, oldest first, with the full count."""
+        for i in range(25):
+            webhook_server.append_event({"id": i})
+        
+        data = json.loads(await server.get_recent_actions_events(limit=10))
+        
+        assert [event["id"] for event in data["events"]] == list(range(15, 25))
+        assert data["total_events"] == 25
+        assert data["showing"] == 10
+    
+    @pytest.mark.asyncio
+    async def test_recent_events_from_json_dump(self, events_file):
+        """A file written by json.dump, as earlier versions did, reads the same way."""
+        events_file.write_text(json.dumps([{"id": i} for i in range(25)], indent=2))
+        
+        data = json.loads(await server.get_recent_actions_events(limit=10))
+        
+        assert [event["id"] for event in data["events"]] == list(range(15, 25))
+        assert data["total_events"] == 25
+        assert data["showing"] == 10
+    
+    @pytest.mark.asyncio
+    async def test_workflow_status_uses_latest_run(self, events_file):
+        """Each workflow reports its most recent run."""
+        def workflow_run(conclusion, updated_at):
+            return {
+                "type": "workflow_run",
+                "payload": {"workflow_run": {
+                    "name": "CI",
+                    "status": "completed",
+                    "conclusion": conclusion,
+                    "updated_at": updated_at
+                }}
+            }
+        
+        webhook_server.append_event(workflow_run("failure", "2024-01-02T00:00:00Z"))
+        webhook_server.append_event(workflow_run("success", "2024-01-01T00:00:00Z"))
+        
+        data = json.loads(await server.get_workflow_status())
+        
+        assert data["total_workflows"] == 1
+        assert data["workflows"]["CI"]["conclusion"] == "failure"
+
+
 if __name__ == "__main__":
     if not IMPORTS_SUCCESSFUL:
         print(f"❌ Cannot run tests - imports failed: {IMPORT_ERROR}")
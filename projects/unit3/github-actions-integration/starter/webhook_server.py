@@ -5,13 +5,70 @@ Stores events in a JSON file that the MCP server can read.
 """
 
 import json
+import os
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
+
 from aiohttp import web
 
-# File to store events
+# File to store events: a JSON array with one event per line
 EVENTS_FILE = Path(__file__).parent / "github_events.json"
 
+# Number of events to keep; the file is compacted back to this once it doubles
+MAX_EVENTS = 100
+
+# Number of events currently in the file, counted on first use
+_event_count: Optional[int] = None
+
+
+def read_events():
+    """Read all events from the file, oldest first"""
+    if not EVENTS_FILE.exists():
+        return []
+    with open(EVENTS_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_events(events):
+    """Replace the file with the given events"""
+    tmp_file = EVENTS_FILE.with_suffix('.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write('[\n' + ',\n'.join(json.dumps(event) for event in events) + '\n]\n')
+    os.replace(tmp_file, EVENTS_FILE)
+
+
+def append_event(event):
+    """Add one event to the end of the array without rewriting the file"""
+    global _event_count
+    if _event_count is None:
+        _event_count = len(read_events())
+    
+    if not EVENTS_FILE.exists():
+        write_events([event])
+    else:
+        with open(EVENTS_FILE, 'r+b') as f:
+            # Find the array's closing bracket among the last few KiB
+            end = f.seek(0, os.SEEK_END)
+            tail_start = max(end - 4096, 0)
+            f.seek(tail_start)
+            tail = f.read().rstrip()
+            if not tail.endswith(b']'):
+                raise ValueError(f"{EVENTS_FILE.name} does not hold a JSON array")
+            
+            # Overwrite the bracket with the new event and close the array again
+            separator = b'\n' if tail[:-1].rstrip().endswith(b'[') else b',\n'
+            f.seek(tail_start + len(tail) - 1)
+            f.write(separator + json.dumps(event).encode('utf-8') + b'\n]\n')
+            f.truncate()
+    _event_count += 1
+    
+    # Keep the last MAX_EVENTS once the file has grown to twice that
+    if _event_count > 2 * MAX_EVENTS:
+        write_events(read_events()[-MAX_EVENTS:])
+        _event_count = MAX_EVENTS
+
+
 async def handle_webhook(request):
     """Handle incoming GitHub webhook"""
     try:
@@ -28,19 +85,8 @@ async def handle_webhook(request):
             "sender": data.get("sender", {}).get("login")
         }
         
-        # Load existing events
-        events = []
-        if EVENTS_FILE.exists():
-            with open(EVENTS_FILE, 'r') as f:
-                events = json.load(f)
-        
-        # Add new event and keep last 100
-        events.append(event)
-        events = events[-100:]
-        
-        # Save events
-        with open(EVENTS_FILE, 'w') as f:
-            json.dump(events, f, indent=2)
+        # Save event
+        append_event(event)
         
         return web.json_response({"status": "received"})
     except Exception as e: